@@ -1,163 +1,327 @@
 import os
+import atexit
+from abc import ABC, abstractmethod
+import hashlib
+import json
+import queue
+import threading
+import diskcache
 import requests
-from datetime import datetime
-from tinydb import TinyDB, Query
+from requests.adapters import HTTPAdapter
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Dict, List, Optional
-import uuid
-
-# Database setup
-db = TinyDB(os.path.join(os.path.dirname(__file__), "../../memory/memory_store.json"))
-Topic = Query()
-Workflow = Query()
-Session = Query()
-
-
-def call_llm(prompt: str) -> str:
-    """Call the local LLM API."""
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={"model": "llama3", "prompt": prompt, "stream": False}
-    )
-    return response.json()["response"].strip()
-
-
-def log_agent_response(topic: str, agent: str, content: str, session_id: str = None):
-    """Log agent response to database with optional session tracking."""
-    entry = {
-        "agent": agent,
-        "content": content,
-        "timestamp": datetime.utcnow().isoformat(),
-        "session_id": session_id
-    }
-
-    if db.contains(Topic.name == topic):
-        db.update(lambda t: t["log"].append(entry), Topic.name == topic)
-    else:
-        db.insert({"name": topic, "log": [entry]})
-
-
-def get_topic_log(topic: str, session_id: str = None) -> List[Dict]:
-    """Retrieve logs for a topic, optionally filtered by session."""
-    result = db.search(Topic.name == topic)
-    if not result:
-        return []
-
-    logs = result[0]["log"]
-
-    if session_id:
-        logs = [log for log in logs if log.get("session_id") == session_id]
-
-    return logs
-
-
-def create_workflow(name: str, topic: str, agents: List[str], schedule: str,
-                    notification_config: Dict = None) -> str:
-    """Create a new workflow configuration."""
-    workflow_id = str(uuid.uuid4())
-    workflow = {
-        "id": workflow_id,
-        "name": name,
-        "topic": topic,
-        "agents": agents,
-        "schedule": schedule,
-        "notification_config": notification_config or {},
-        "created_at": datetime.utcnow().isoformat(),
-        "active": True,
-        "last_run": None
-    }
-
-    db.insert(workflow)
-    return workflow_id
-
-
-def get_workflow(workflow_id: str) -> Optional[Dict]:
-    """Retrieve a workflow by ID."""
-    result = db.search(Workflow.id == workflow_id)
-    return result[0] if result else None
-
-
-def get_all_workflows() -> List[Dict]:
-    """Get all workflows."""
-    return db.search(Workflow.id.exists())
-
-
-def update_workflow(workflow_id: str, updates: Dict) -> bool:
-    """Update a workflow configuration."""
-    try:
-        db.update(updates, Workflow.id == workflow_id)
+from typing import Dict, Iterable
+from urllib.parse import urlsplit
+from jinja2 import Template
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+from .store import log_agent_response, get_topic_log
+
+# LLM configuration
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+LLM_TIMEOUT = 120
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+# Seconds before a stalled SMTP connect or command gives up (the email worker is a single thread)
+SMTP_TIMEOUT = 30
+
+# Deterministic LLM response cache (opt-in)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))
+_llm_cache = diskcache.Cache(
+    os.path.join(os.path.dirname(__file__), "../../memory/llm_cache"),
+    size_limit=1 << 30,
+    eviction_policy="least-recently-used"
+) if LLM_CACHE_ENABLED else None
+LLM_CACHE_STATS = {"hits": 0, "misses": 0}
+
+# HTTP statuses worth retrying (rate limiting and gateway/server hiccups)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class _AdaptiveLimiter:
+    """Concurrency cap that halves on rate limiting and grows back by one per success (AIMD)."""
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            if self.limit < self.max_limit:
+                self.limit += 1
+                self._cond.notify_all()
+
+    def on_rate_limited(self):
+        with self._cond:
+            self.limit = max(1, self.limit // 2)
+
+
+# Caps in-flight LLM requests across all concurrently running agents
+_LLM_LIMITER = _AdaptiveLimiter(LLM_MAX_CONCURRENCY)
+
+
+def _is_transient_http_error(exc: BaseException) -> bool:
+    """Return True for connection problems and retryable HTTP statuses."""
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and exc.response.status_code in RETRYABLE_STATUS
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout,
+                            requests.exceptions.ChunkedEncodingError))
+
+
+def _is_transient_smtp_error(exc: BaseException) -> bool:
+    """Return True for dropped connections and temporary (4xx) SMTP replies."""
+    if isinstance(exc, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
         return True
-    except Exception:
-        return False
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
 
 
-def delete_workflow(workflow_id: str) -> bool:
-    """Delete a workflow."""
-    try:
-        db.remove(Workflow.id == workflow_id)
-        return True
-    except Exception:
-        return False
+_retry_http = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=1, max=10),
+    retry=retry_if_exception(_is_transient_http_error),
+    reraise=True
+)
 
+_retry_smtp = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=1, max=10),
+    retry=retry_if_exception(_is_transient_smtp_error),
+    reraise=True
+)
 
-def create_workflow_session(workflow_id: str) -> str:
-    """Create a new session for workflow execution."""
-    session_id = str(uuid.uuid4())
-    session = {
-        "id": session_id,
-        "workflow_id": workflow_id,
-        "started_at": datetime.utcnow().isoformat(),
-        "completed_at": None,
-        "status": "running",
-        "results": [],
-        "errors": []
-    }
 
-    db.insert(session)
-    return session_id
+def _pooled_session(pool_maxsize: int) -> requests.Session:
+    """Create a keep-alive HTTP session so repeated calls reuse connections."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
-def update_session_status(session_id: str, status: str, completed_at: str = None):
-    """Update session status."""
-    updates = {"status": status}
-    if completed_at:
-        updates["completed_at"] = completed_at
+# Shared HTTP sessions (one per outbound service)
+_LLM_SESSION = _pooled_session(pool_maxsize=32)
+_SLACK_SESSION = _pooled_session(pool_maxsize=8)
+atexit.register(_LLM_SESSION.close)
+atexit.register(_SLACK_SESSION.close)
+if _llm_cache is not None:
+    atexit.register(_llm_cache.close)
 
-    db.update(updates, Session.id == session_id)
 
+def warm_up_connections(slack_webhooks: Iterable[str] = ()):
+    """Pre-open pooled connections so the first workflow run doesn't pay for them.
 
-def add_session_result(session_id: str, agent: str, result: str, error: str = None):
-    """Add result to a session."""
-    if error:
-        db.update(lambda s: s["errors"].append({
-            "agent": agent,
-            "error": error,
-            "timestamp": datetime.utcnow().isoformat()
-        }), Session.id == session_id)
-    else:
-        db.update(lambda s: s["results"].append({
-            "agent": agent,
-            "result": result,
-            "timestamp": datetime.utcnow().isoformat()
-        }), Session.id == session_id)
-
+    An empty prompt makes Ollama load the model without generating anything.
+    """
+    try:
+        _LLM_SESSION.post(
+            f"{OLLAMA_URL}/api/generate",
+            json={"model": OLLAMA_MODEL, "prompt": "", "stream": False},
+            timeout=30
+        )
+    except requests.RequestException as e:
+        print(f"LLM warm-up failed: {e}")
 
-def get_session(session_id: str) -> Optional[Dict]:
-    """Get session by ID."""
-    result = db.search(Session.id == session_id)
-    return result[0] if result else None
+    hosts = {urlsplit(url)[:2] for url in slack_webhooks if url}
+    for scheme, netloc in hosts:
+        try:
+            _SLACK_SESSION.head(f"{scheme}://{netloc}/", timeout=5)
+        except requests.RequestException as e:
+            print(f"Slack warm-up failed for {netloc}: {e}")
 
 
-def get_workflow_sessions(workflow_id: str) -> List[Dict]:
-    """Get all sessions for a workflow."""
-    return db.search(Session.workflow_id == workflow_id)
+def call_llm(prompt: str) -> str:
+    """Call the local LLM API, serving repeated prompts from the cache when enabled."""
+    if _llm_cache is None:
+        return _generate(prompt)
+
+    key = hashlib.sha256(f"{OLLAMA_MODEL}\0{prompt}".encode()).hexdigest()
+    cached = _llm_cache.get(key)
+    if cached is not None:
+        LLM_CACHE_STATS["hits"] += 1
+        return cached
+
+    LLM_CACHE_STATS["misses"] += 1
+    answer = _generate(prompt)
+    _llm_cache.set(key, answer, expire=LLM_CACHE_TTL)
+    return answer
+
+
+@_retry_http
+def _generate(prompt: str) -> str:
+    """Stream a completion from the LLM server, retrying transient failures."""
+    parts = []
+    # The slot is held for the whole stream, since the server is busy until "done"
+    with _LLM_LIMITER, _LLM_SESSION.post(
+            f"{OLLAMA_URL}/api/generate",
+            json={"model": OLLAMA_MODEL, "prompt": prompt, "stream": True},
+            timeout=LLM_TIMEOUT,
+            stream=True
+    ) as response:
+        if response.status_code == 429:
+            _LLM_LIMITER.on_rate_limited()
+        response.raise_for_status()
+
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise RuntimeError(f"LLM error: {chunk['error']}")
+            parts.append(chunk.get("response", ""))
+            if chunk.get("done"):
+                break
+
+    _LLM_LIMITER.on_success()
+    return "".join(parts).strip()
+
+
+class Agent(ABC):
+    """Base class for workflow agents; the engine keeps one instance per type."""
+
+    # Name used in workflow definitions
+    name = ""
+    # Label stored with the agent's entries in topic memory
+    log_name = ""
+    # Whether the agent consumes the previous agent's output
+    uses_context = False
+    # Whether the prompt may be built from topic memory, which earlier steps of a run
+    # write to; such agents only start once every earlier step has finished
+    reads_memory = True
+
+    @abstractmethod
+    def run(self, topic: str, context: str = None, query: str = None, writes=None) -> str:
+        """Run the agent on a topic and return its answer.
+
+        ``writes`` is this step's StepWrites view of the running workflow's buffer,
+        if any; memory reads and writes go through it so they land in the run's
+        single commit and only see what earlier steps wrote.
+        """
+
+    def memory(self, topic: str, writes=None) -> str:
+        """Return everything logged so far for a topic, including earlier steps' buffered entries."""
+        entries = get_topic_log(topic)
+        if writes is not None:
+            entries = entries + writes.pending_topic_log(topic)
+        return "\n".join([m["content"] for m in entries])
+
+    def respond(self, topic: str, prompt: str, writes=None) -> str:
+        """Ask the LLM and record the answer in topic memory."""
+        answer = call_llm(prompt)
+        if writes is not None:
+            writes.log_agent_response(topic, self.log_name, answer)
+        else:
+            log_agent_response(topic, self.log_name, answer)
+        return answer
+
+
+class _SMTPConnection:
+    """Long-lived SMTP session, reused while the server settings stay the same."""
+
+    def __init__(self):
+        self.server = None
+        self.settings = None
+
+    def send(self, msg: MIMEMultipart, to_email: str, smtp_config: Dict):
+        settings = (smtp_config["smtp_server"], smtp_config["smtp_port"], smtp_config["username"])
+        if self.server is None or self.settings != settings:
+            self.close()
+            server = smtplib.SMTP(smtp_config["smtp_server"], smtp_config["smtp_port"],
+                                  timeout=SMTP_TIMEOUT)
+            try:
+                server.starttls()
+                server.login(smtp_config["username"], smtp_config["password"])
+            except Exception:
+                server.close()
+                raise
+            self.server, self.settings = server, settings
+
+        try:
+            self.server.sendmail(smtp_config["username"], to_email, msg.as_string())
+        except Exception:
+            # Connection state is unknown; reconnect on the next attempt
+            self.close()
+            raise
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                self.server.close()
+        self.server = None
+        self.settings = None
+
+
+# Emails are delivered by a single background worker that owns the SMTP session
+EMAIL_IDLE_TIMEOUT = 60
+_email_queue = queue.Queue()
+_smtp_connection = _SMTPConnection()
+
+
+@_retry_smtp
+def _deliver_email(msg: MIMEMultipart, to_email: str, smtp_config: Dict):
+    """Send a prepared message over the shared SMTP session."""
+    _smtp_connection.send(msg, to_email, smtp_config)
+
+
+def _email_worker():
+    """Drain the email queue; a None item stops the worker."""
+    while True:
+        try:
+            item = _email_queue.get(timeout=EMAIL_IDLE_TIMEOUT)
+        except queue.Empty:
+            # Don't hold an idle session open until the server drops it
+            _smtp_connection.close()
+            continue
+
+        try:
+            if item is None:
+                break
+            msg, to_email, smtp_config = item
+            try:
+                _deliver_email(msg, to_email, smtp_config)
+            except Exception as e:
+                print(f"Failed to send email: {e}")
+        finally:
+            _email_queue.task_done()
+
+    _smtp_connection.close()
+
+
+def _stop_email_worker():
+    """Flush queued emails and close the SMTP session on shutdown."""
+    _email_queue.put(None)
+    _email_thread.join(timeout=30)
+
+
+_email_thread = threading.Thread(target=_email_worker, name="email-worker", daemon=True)
+_email_thread.start()
+atexit.register(_stop_email_worker)
 
 
 def send_email_notification(to_email: str, subject: str, body: str,
                             smtp_config: Dict = None):
-    """Send email notification."""
+    """Queue an email notification for background delivery."""
     if not smtp_config:
         # Default SMTP configuration (adjust as needed)
         smtp_config = {
@@ -175,89 +339,90 @@ def send_email_notification(to_email: str, subject: str, body: str,
 
         msg.attach(MIMEText(body, 'html'))
 
-        server = smtplib.SMTP(smtp_config["smtp_server"], smtp_config["smtp_port"])
-        server.starttls()
-        server.login(smtp_config["username"], smtp_config["password"])
-        text = msg.as_string()
-        server.sendmail(smtp_config["username"], to_email, text)
-        server.quit()
+        _email_queue.put((msg, to_email, smtp_config))
 
         return True
     except Exception as e:
-        print(f"Failed to send email: {e}")
+        print(f"Failed to queue email: {e}")
         return False
 
 
+@_retry_http
+def _post_slack(webhook_url: str, payload: Dict) -> requests.Response:
+    """POST a payload to a Slack webhook, retrying transient failures."""
+    response = _SLACK_SESSION.post(webhook_url, json=payload, timeout=10)
+    response.raise_for_status()
+    return response
+
+
 def send_slack_notification(webhook_url: str, message: str):
     """Send Slack notification."""
     try:
         payload = {"text": message}
-        response = requests.post(webhook_url, json=payload)
+        response = _post_slack(webhook_url, payload)
         return response.status_code == 200
     except Exception as e:
         print(f"Failed to send Slack notification: {e}")
         return False
 
 
-def notify_workflow_completion(workflow: Dict, session: Dict):
-    """Send notifications for completed workflow."""
-    notification_config = workflow.get("notification_config", {})
-
-    # Prepare notification content
-    subject = f"Workflow '{workflow['name']}' Completed"
-
-    results_summary = []
-    for result in session.get("results", []):
-        results_summary.append(f"• {result['agent']}: {result['result'][:100]}...")
-
-    errors_summary = []
-    for error in session.get("errors", []):
-        errors_summary.append(f"• {error['agent']}: {error['error']}")
-
-    body = f"""
+# Compiled once; LLM output is HTML-escaped when rendered
+_WORKFLOW_EMAIL_TEMPLATE = Template("""
     <h2>Workflow Execution Summary</h2>
-    <p><strong>Workflow:</strong> {workflow['name']}</p>
-    <p><strong>Topic:</strong> {workflow['topic']}</p>
-    <p><strong>Started:</strong> {session['started_at']}</p>
-    <p><strong>Completed:</strong> {session['completed_at']}</p>
-    <p><strong>Status:</strong> {session['status']}</p>
+    <p><strong>Workflow:</strong> {{ workflow.name }}</p>
+    <p><strong>Topic:</strong> {{ workflow.topic }}</p>
+    <p><strong>Started:</strong> {{ session.started_at }}</p>
+    <p><strong>Completed:</strong> {{ session.completed_at }}</p>
+    <p><strong>Status:</strong> {{ session.status }}</p>
 
     <h3>Results:</h3>
     <ul>
-    {''.join(f'<li>{result}</li>' for result in results_summary)}
+    {% for result in session.results %}<li>• {{ result.agent }}: {{ result.result[:100] }}...</li>{% endfor %}
     </ul>
 
-    {f'<h3>Errors:</h3><ul>{"".join(f"<li>{error}</li>" for error in errors_summary)}</ul>' if errors_summary else ''}
-    """
+    {% if session.errors %}<h3>Errors:</h3><ul>{% for error in session.errors %}<li>• {{ error.agent }}: {{ error.error }}</li>{% endfor %}</ul>{% endif %}
+    """, autoescape=True)
+
+
+def notify_workflow_completion(workflow: Dict, session: Dict):
+    """Send notifications for completed workflow."""
+    notification_config = workflow.get("notification_config") or {}
+    email = notification_config.get("email")
+    slack_webhook = notification_config.get("slack_webhook")
+
+    # Nothing to build when no channel is configured
+    if not email and not slack_webhook:
+        return
 
     # Send email notification
-    if notification_config.get("email"):
+    if email:
+        subject = f"Workflow '{workflow['name']}' Completed"
+        body = _WORKFLOW_EMAIL_TEMPLATE.render(workflow=workflow, session=session)
         send_email_notification(
-            notification_config["email"],
+            email,
             subject,
             body,
             notification_config.get("smtp_config")
         )
 
     # Send Slack notification
-    if notification_config.get("slack_webhook"):
+    if slack_webhook:
         slack_message = f"🤖 Workflow '{workflow['name']}' completed for topic '{workflow['topic']}'. Status: {session['status']}"
         if session.get("errors"):
             slack_message += f" (with {len(session['errors'])} errors)"
 
-        send_slack_notification(notification_config["slack_webhook"], slack_message)
+        send_slack_notification(slack_webhook, slack_message)
 
 
 def format_workflow_results(session: Dict) -> str:
     """Format workflow results for dashboard display."""
-    results_text = []
-
-    for result in session.get("results", []):
-        results_text.append(f"**{result['agent']}** ({result['timestamp']}):\n{result['result']}\n")
+    results_text = [
+        f"**{result['agent']}** ({result['timestamp']}):\n{result['result']}\n"
+        for result in session.get("results", [])
+    ]
 
     if session.get("errors"):
         results_text.append("\n**Errors:**\n")
-        for error in session["errors"]:
-            results_text.append(f"• {error['agent']}: {error['error']}\n")
+        results_text.extend([f"• {error['agent']}: {error['error']}\n" for error in session["errors"]])
 
-    return "\n".join(results_text)
\ No newline at end of file
+    return "\n".join(results_text)
@@ -1,8 +1,11 @@
-from .base import call_llm, log_agent_response, get_topic_log
+from .base import Agent
 
-def run(topic: str):
-    memory = "\n".join([m["content"] for m in get_topic_log(topic)])
-    prompt = f"Based on the following content, play devil's advocate and raise potential challenges or counterarguments:\n\n{memory}"
-    challenge = call_llm(prompt)
-    log_agent_response(topic, "Devil’s Advocate", challenge)
-    return challenge
+
+class DevilAgent(Agent):
+    name = "Devil"
+    log_name = "Devil’s Advocate"
+
+    def run(self, topic: str, context: str = None, query: str = None, writes=None) -> str:
+        memory = self.memory(topic, writes)
+        prompt = f"Based on the following content, play devil's advocate and raise potential challenges or counterarguments:\n\n{memory}"
+        return self.respond(topic, prompt, writes)
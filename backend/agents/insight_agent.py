@@ -1,7 +1,12 @@
-from .base import call_llm, log_agent_response, get_topic_log
-def run(topic: str):
-    memory = "\n".join([m["content"] for m in get_topic_log(topic)])
-    prompt = f"Extract key insights or takeaways from this content:\n\n{memory}"
-    insight = call_llm(prompt)
-    log_agent_response(topic, "Insight Agent", insight)
-    return insight
\ No newline at end of file
+from .base import Agent
+
+
+class InsightAgent(Agent):
+    name = "Insight"
+    log_name = "Insight Agent"
+    uses_context = True
+
+    def run(self, topic: str, context: str = None, query: str = None, writes=None) -> str:
+        content = context or self.memory(topic, writes)
+        prompt = f"Extract key insights or takeaways from this content:\n\n{content}"
+        return self.respond(topic, prompt, writes)
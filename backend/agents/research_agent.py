@@ -1,6 +1,12 @@
-from .base import call_llm, log_agent_response, get_topic_log
-def run(topic: str, query: str):
-    prompt = f"Research question: {query}\nRespond factually and concisely."
-    answer = call_llm(prompt)
-    log_agent_response(topic, "Research Agent", answer)
-    return answer
\ No newline at end of file
+from .base import Agent
+
+
+class ResearchAgent(Agent):
+    name = "Research"
+    log_name = "Research Agent"
+    reads_memory = False
+
+    def run(self, topic: str, context: str = None, query: str = None, writes=None) -> str:
+        query = query or f"latest developments in {topic}"
+        prompt = f"Research question: {query}\nRespond factually and concisely."
+        return self.respond(topic, prompt, writes)
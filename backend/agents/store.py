@@ -0,0 +1,564 @@
+import os
+import atexit
+import functools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Database setup
+MEMORY_DIR = os.path.join(os.path.dirname(__file__), "../../memory")
+DB_PATH = os.path.join(MEMORY_DIR, "memory_store.sqlite3")
+LEGACY_JSON_PATH = os.path.join(MEMORY_DIR, "memory_store.json")
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    session_id TEXT,
+    agent TEXT NOT NULL,
+    content TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_logs_topic_session ON logs (topic, session_id);
+
+CREATE TABLE IF NOT EXISTS workflows (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    agents TEXT NOT NULL,
+    schedule TEXT NOT NULL,
+    notification_config TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    last_run TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    workflow_id TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    completed_at TEXT,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_workflow_started ON sessions (workflow_id, started_at);
+
+CREATE TABLE IF NOT EXISTS session_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    result TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_session_results_session ON session_results (session_id);
+
+CREATE TABLE IF NOT EXISTS session_errors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    error TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_session_errors_session ON session_errors (session_id);
+"""
+
+# Workflow fields stored as JSON text, and columns update_workflow may touch
+_JSON_FIELDS = {"agents", "notification_config"}
+_WORKFLOW_COLUMNS = {"name", "topic", "agents", "schedule", "notification_config",
+                     "active", "last_run"}
+
+# Statements on the hot write path, shared so sqlite3's statement cache reuses them
+_INSERT_LOG_SQL = "INSERT INTO logs (topic, session_id, agent, content, timestamp) VALUES (?, ?, ?, ?, ?)"
+_INSERT_RESULT_SQL = "INSERT INTO session_results (session_id, agent, result, timestamp) VALUES (?, ?, ?, ?)"
+_INSERT_ERROR_SQL = "INSERT INTO session_errors (session_id, agent, error, timestamp) VALUES (?, ?, ?, ?)"
+_SESSION_STATUS_SQL = "UPDATE sessions SET status = ? WHERE id = ?"
+_SESSION_COMPLETED_SQL = "UPDATE sessions SET status = ?, completed_at = ? WHERE id = ?"
+_TOPIC_LOG_SQL = "SELECT agent, content, timestamp, session_id FROM logs WHERE topic = ? ORDER BY id"
+_TOPIC_SESSION_LOG_SQL = ("SELECT agent, content, timestamp, session_id FROM logs "
+                          "WHERE topic = ? AND session_id = ? ORDER BY id")
+
+_local = threading.local()
+_init_lock = threading.Lock()
+# Serializes writers inside this process; under WAL, readers never wait on it
+_write_lock = threading.RLock()
+_initialized = False
+_connections = []
+
+
+def _connect() -> sqlite3.Connection:
+    """Return this thread's connection, creating the schema on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode this only syncs at checkpoints instead of on every commit
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+        with _init_lock:
+            _connections.append(conn)
+        _ensure_schema(conn)
+    return conn
+
+
+_CROCKFORD_BASE32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def _new_ulid() -> str:
+    """Return a ULID: 48-bit millisecond timestamp + 80 random bits, 26 chars.
+
+    ULIDs sort lexicographically by creation time, which keeps freshly
+    inserted session keys adjacent in the primary-key index.
+    """
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), "big")
+    chars = []
+    for _ in range(26):
+        value, index = divmod(value, 32)
+        chars.append(_CROCKFORD_BASE32[index])
+    return "".join(reversed(chars))
+
+
+def _execute_write(sql: str, params: tuple = ()):
+    """Run a single write statement while holding the process write lock."""
+    with _write_lock:
+        _connect().execute(sql, params)
+
+
+def checkpoint():
+    """Fold the write-ahead log back into the database file and sync it."""
+    _connect().execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+
+def close_connections():
+    """Checkpoint and close every connection opened by this process."""
+    with _init_lock:
+        connections = list(_connections)
+        _connections.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+atexit.register(close_connections)
+
+
+def _ensure_schema(conn: sqlite3.Connection):
+    """Create tables once per process and import the legacy TinyDB file if present."""
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        conn.executescript(SCHEMA)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            if version < 1:
+                _import_legacy_json(conn)
+            if version < 2:
+                # Superseded by idx_sessions_workflow_started
+                conn.execute("DROP INDEX IF EXISTS idx_sessions_workflow")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        _initialized = True
+
+
+def _import_legacy_json(conn: sqlite3.Connection):
+    """Copy topics, workflows and sessions from the old TinyDB memory_store.json."""
+    if not os.path.exists(LEGACY_JSON_PATH):
+        return
+
+    try:
+        with open(LEGACY_JSON_PATH, encoding="utf-8") as f:
+            documents = list(json.load(f).get("_default", {}).values())
+    except (OSError, ValueError) as e:
+        print(f"Skipping legacy memory import: {e}")
+        return
+
+    conn.execute("BEGIN")
+    try:
+        for doc in documents:
+            if "log" in doc:
+                conn.executemany(
+                    _INSERT_LOG_SQL,
+                    [(doc["name"], e.get("session_id"), e["agent"], e.get("content"), e.get("timestamp"))
+                     for e in doc["log"]]
+                )
+            elif "workflow_id" in doc:
+                conn.execute(
+                    "INSERT OR IGNORE INTO sessions (id, workflow_id, started_at, completed_at, status) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (doc["id"], doc["workflow_id"], doc["started_at"], doc.get("completed_at"), doc["status"])
+                )
+                conn.executemany(
+                    _INSERT_RESULT_SQL,
+                    [(doc["id"], r["agent"], r.get("result"), r["timestamp"]) for r in doc.get("results", [])]
+                )
+                conn.executemany(
+                    _INSERT_ERROR_SQL,
+                    [(doc["id"], e["agent"], e.get("error"), e["timestamp"]) for e in doc.get("errors", [])]
+                )
+            elif "schedule" in doc:
+                conn.execute(
+                    "INSERT OR IGNORE INTO workflows (id, name, topic, agents, schedule, notification_config, "
+                    "created_at, active, last_run) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (doc["id"], doc["name"], doc["topic"], json.dumps(doc["agents"]), doc["schedule"],
+                     json.dumps(doc.get("notification_config") or {}), doc["created_at"],
+                     int(doc.get("active", True)), doc.get("last_run"))
+                )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+_WORKFLOW_SELECT = ("SELECT id, name, topic, agents, schedule, notification_config, "
+                    "created_at, active, last_run FROM workflows")
+_GET_WORKFLOW_SQL = f"{_WORKFLOW_SELECT} WHERE id = ?"
+_ALL_WORKFLOWS_SQL = f"{_WORKFLOW_SELECT} ORDER BY created_at"
+
+
+def _workflow_from_row(row) -> Dict:
+    """Convert a workflows row into the workflow dict used by the API."""
+    return {
+        "id": row[0],
+        "name": row[1],
+        "topic": row[2],
+        "agents": json.loads(row[3]),
+        "schedule": row[4],
+        "notification_config": json.loads(row[5]),
+        "created_at": row[6],
+        "active": bool(row[7]),
+        "last_run": row[8]
+    }
+
+
+def _log_statement(topic: str, agent: str, content: str, session_id: str = None) -> Tuple[str, tuple]:
+    return _INSERT_LOG_SQL, (topic, session_id, agent, content, datetime.utcnow().isoformat())
+
+
+@functools.lru_cache(maxsize=128)
+def _update_workflow_sql(columns: Tuple[str, ...]) -> str:
+    """Build (once per column combination) the UPDATE for a set of workflow columns."""
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    return f"UPDATE workflows SET {assignments} WHERE id = ?"
+
+
+def _workflow_update_statement(workflow_id: str, updates: Dict) -> Optional[Tuple[str, tuple]]:
+    columns = tuple(column for column in updates if column in _WORKFLOW_COLUMNS)
+    if not columns:
+        return None
+
+    values = []
+    for column in columns:
+        value = updates[column]
+        if column in _JSON_FIELDS:
+            value = json.dumps(value)
+        elif column == "active":
+            value = int(bool(value))
+        values.append(value)
+
+    return _update_workflow_sql(columns), (*values, workflow_id)
+
+
+def _session_status_statement(session_id: str, status: str, completed_at: str = None) -> Tuple[str, tuple]:
+    if completed_at:
+        return _SESSION_COMPLETED_SQL, (status, completed_at, session_id)
+    return _SESSION_STATUS_SQL, (status, session_id)
+
+
+def _session_result_statement(session_id: str, agent: str, result: str, error: str = None,
+                              timestamp: str = None) -> Tuple[str, tuple]:
+    timestamp = timestamp or datetime.utcnow().isoformat()
+    if error:
+        return _INSERT_ERROR_SQL, (session_id, agent, error, timestamp)
+    return _INSERT_RESULT_SQL, (session_id, agent, result, timestamp)
+
+
+def _log_entry_from_row(cursor: sqlite3.Cursor, row: tuple) -> Dict:
+    """Row factory building log entry dicts straight from result rows."""
+    return {"agent": row[0], "content": row[1], "timestamp": row[2], "session_id": row[3]}
+
+
+def log_agent_response(topic: str, agent: str, content: str, session_id: str = None):
+    """Log agent response to database with optional session tracking."""
+    _execute_write(*_log_statement(topic, agent, content, session_id))
+
+
+def get_topic_log(topic: str, session_id: str = None) -> List[Dict]:
+    """Retrieve logs for a topic, optionally filtered by session."""
+    cursor = _connect().cursor()
+    cursor.row_factory = _log_entry_from_row
+    if session_id:
+        # Seeks idx_logs_topic_session on both columns
+        cursor.execute(_TOPIC_SESSION_LOG_SQL, (topic, session_id))
+    else:
+        cursor.execute(_TOPIC_LOG_SQL, (topic,))
+    return cursor.fetchall()
+
+
+def create_workflow(name: str, topic: str, agents: List[str], schedule: str,
+                    notification_config: Dict = None) -> str:
+    """Create a new workflow configuration."""
+    workflow_id = str(uuid.uuid4())
+    _execute_write(
+        "INSERT INTO workflows (id, name, topic, agents, schedule, notification_config, "
+        "created_at, active, last_run) VALUES (?, ?, ?, ?, ?, ?, ?, 1, NULL)",
+        (workflow_id, name, topic, json.dumps(agents), schedule,
+         json.dumps(notification_config or {}), datetime.utcnow().isoformat())
+    )
+    return workflow_id
+
+
+def get_workflow(workflow_id: str) -> Optional[Dict]:
+    """Retrieve a workflow by ID."""
+    row = _connect().execute(_GET_WORKFLOW_SQL, (workflow_id,)).fetchone()
+    return _workflow_from_row(row) if row else None
+
+
+def get_all_workflows() -> List[Dict]:
+    """Get all workflows."""
+    rows = _connect().execute(_ALL_WORKFLOWS_SQL).fetchall()
+    return [_workflow_from_row(row) for row in rows]
+
+
+def update_workflow(workflow_id: str, updates: Dict) -> bool:
+    """Update a workflow configuration."""
+    statement = _workflow_update_statement(workflow_id, updates)
+    if statement is None:
+        return True
+
+    try:
+        _execute_write(*statement)
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def delete_workflow(workflow_id: str) -> bool:
+    """Delete a workflow."""
+    try:
+        _execute_write("DELETE FROM workflows WHERE id = ?", (workflow_id,))
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def create_workflow_session(workflow_id: str) -> str:
+    """Create a new session for workflow execution."""
+    session_id = _new_ulid()
+    _execute_write(
+        "INSERT INTO sessions (id, workflow_id, started_at, completed_at, status) "
+        "VALUES (?, ?, ?, NULL, 'running')",
+        (session_id, workflow_id, datetime.utcnow().isoformat())
+    )
+    return session_id
+
+
+def update_session_status(session_id: str, status: str, completed_at: str = None):
+    """Update session status."""
+    _execute_write(*_session_status_statement(session_id, status, completed_at))
+
+
+def add_session_result(session_id: str, agent: str, result: str, error: str = None,
+                       timestamp: str = None):
+    """Add result to a session; ``timestamp`` defaults to now."""
+    _execute_write(*_session_result_statement(session_id, agent, result, error, timestamp))
+
+
+class WorkflowWriteBuffer:
+    """Collect the writes of one workflow run and commit them in a single transaction.
+
+    Exposes the same write helpers as this module; nothing reaches the database
+    until flush() is called, which the engine does when the run ends.
+    Agents running on worker threads may write to the same buffer concurrently.
+    """
+
+    def __init__(self):
+        # (step, sql, params); step is the index of the workflow step that wrote
+        # the statement, or None for run-level writes
+        self._statements = []
+        self._lock = threading.Lock()
+
+    def _append(self, statement: Tuple[str, tuple], step: int = None):
+        with self._lock:
+            self._statements.append((step, *statement))
+
+    def log_agent_response(self, topic: str, agent: str, content: str, session_id: str = None,
+                           step: int = None):
+        self._append(_log_statement(topic, agent, content, session_id), step)
+
+    def add_session_result(self, session_id: str, agent: str, result: str, error: str = None,
+                           timestamp: str = None):
+        self._append(_session_result_statement(session_id, agent, result, error, timestamp))
+
+    def update_session_status(self, session_id: str, status: str, completed_at: str = None):
+        self._append(_session_status_statement(session_id, status, completed_at))
+
+    def update_workflow(self, workflow_id: str, updates: Dict):
+        statement = _workflow_update_statement(workflow_id, updates)
+        if statement is not None:
+            self._append(statement)
+
+    def for_step(self, step: int) -> "StepWrites":
+        """View of this buffer for one workflow step; see StepWrites."""
+        return StepWrites(self, step)
+
+    def pending_topic_log(self, topic: str, before_step: int = None) -> List[Dict]:
+        """Log entries for a topic that are buffered but not yet written, in workflow order.
+
+        With ``before_step``, only entries written by earlier steps are returned, so a
+        step never sees the output of a later step that happened to finish first.
+        """
+        with self._lock:
+            statements = sorted(self._statements, key=_workflow_order)
+        return [
+            {"agent": params[2], "content": params[3], "timestamp": params[4], "session_id": params[1]}
+            for step, sql, params in statements
+            if sql == _INSERT_LOG_SQL and params[0] == topic
+            and (before_step is None or (step is not None and step < before_step))
+        ]
+
+    def flush(self):
+        """Write all buffered statements, falling back to one-by-one on failure.
+
+        Step writes are committed in workflow order rather than completion order, so
+        topic memory reads back the same way in later runs.
+        """
+        with self._lock:
+            statements, self._statements = self._statements, []
+        if not statements:
+            return
+        statements = [(sql, params) for _, sql, params in sorted(statements, key=_workflow_order)]
+
+        conn = _connect()
+        with _write_lock:
+            try:
+                # Take the write lock up front rather than upgrading mid-transaction
+                conn.execute("BEGIN IMMEDIATE")
+                for sql, params in statements:
+                    conn.execute(sql, params)
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                print(f"Batched write failed ({e}), saving statements individually")
+                # Keep whatever partial state can still be written
+                for sql, params in statements:
+                    try:
+                        conn.execute(sql, params)
+                    except sqlite3.Error as write_error:
+                        print(f"Failed to write workflow state: {write_error}")
+
+
+def _workflow_order(statement: tuple) -> Tuple[bool, int]:
+    """Sort key putting step writes in step order, then run-level writes (stable)."""
+    step = statement[0]
+    return step is None, step or 0
+
+
+class StepWrites:
+    """One workflow step's view of a WorkflowWriteBuffer.
+
+    Log entries written through it are tagged with the step, and its pending topic
+    log only holds entries from the steps before it.
+    """
+
+    def __init__(self, buffer: WorkflowWriteBuffer, step: int):
+        self._buffer = buffer
+        self.step = step
+
+    def log_agent_response(self, topic: str, agent: str, content: str, session_id: str = None):
+        self._buffer.log_agent_response(topic, agent, content, session_id, step=self.step)
+
+    def pending_topic_log(self, topic: str) -> List[Dict]:
+        return self._buffer.pending_topic_log(topic, before_step=self.step)
+
+
+@functools.lru_cache(maxsize=16)
+def _session_children_sql(scope_sql: str) -> Tuple[str, str]:
+    """Build the results/errors SELECTs for sessions matched by ``scope_sql``."""
+    return (
+        f"SELECT session_id, agent, result, timestamp FROM session_results "
+        f"WHERE session_id IN ({scope_sql}) ORDER BY id",
+        f"SELECT session_id, agent, error, timestamp FROM session_errors "
+        f"WHERE session_id IN ({scope_sql}) ORDER BY id"
+    )
+
+
+def _sessions_from_rows(conn: sqlite3.Connection, rows, scope_sql: str, scope_params: tuple) -> List[Dict]:
+    """Build session dicts from sessions rows, attaching results and errors.
+
+    ``scope_sql`` is a subquery selecting the same session ids as ``rows``.
+    """
+    sessions = {
+        row[0]: {
+            "id": row[0],
+            "workflow_id": row[1],
+            "started_at": row[2],
+            "completed_at": row[3],
+            "status": row[4],
+            "results": [],
+            "errors": []
+        }
+        for row in rows
+    }
+    if not sessions:
+        return []
+
+    results_sql, errors_sql = _session_children_sql(scope_sql)
+    for sid, agent, result, timestamp in conn.execute(results_sql, scope_params):
+        sessions[sid]["results"].append({"agent": agent, "result": result, "timestamp": timestamp})
+    for sid, agent, error, timestamp in conn.execute(errors_sql, scope_params):
+        sessions[sid]["errors"].append({"agent": agent, "error": error, "timestamp": timestamp})
+
+    return list(sessions.values())
+
+
+def get_session(session_id: str) -> Optional[Dict]:
+    """Get session by ID."""
+    conn = _connect()
+    rows = conn.execute(
+        "SELECT id, workflow_id, started_at, completed_at, status FROM sessions WHERE id = ?",
+        (session_id,)
+    ).fetchall()
+    sessions = _sessions_from_rows(conn, rows, "?", (session_id,))
+    return sessions[0] if sessions else None
+
+
+def get_workflow_sessions(workflow_id: str, status: Optional[str] = None, limit: Optional[int] = None,
+                          before: Optional[Tuple[str, str]] = None) -> List[Dict]:
+    """Get sessions for a workflow, optionally only those with ``status``.
+
+    Without ``limit`` every session is returned oldest first. With ``limit`` a page of
+    the newest sessions is returned, continuing after the ``before`` keyset cursor,
+    the (started_at, id) of the previous page's last session.
+    """
+    where, params = ["workflow_id = ?"], [workflow_id]
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    if before:
+        where.append("(started_at < ? OR (started_at = ? AND id < ?))")
+        params.extend((before[0], before[0], before[1]))
+
+    scope = f"FROM sessions WHERE {' AND '.join(where)}"
+    conn = _connect()
+    if not limit:
+        rows = conn.execute(
+            f"SELECT id, workflow_id, started_at, completed_at, status {scope} ORDER BY started_at",
+            tuple(params)
+        ).fetchall()
+        return _sessions_from_rows(conn, rows, f"SELECT id {scope}", tuple(params))
+
+    rows = conn.execute(
+        f"SELECT id, workflow_id, started_at, completed_at, status {scope} "
+        "ORDER BY started_at DESC, id DESC LIMIT ?",
+        (*params, limit)
+    ).fetchall()
+    # Scope results and errors to the ids just fetched rather than re-running the page query
+    ids = tuple(row[0] for row in rows)
+    return _sessions_from_rows(conn, rows, ", ".join("?" * len(ids)), ids)
@@ -1,8 +1,12 @@
-from .base import call_llm, log_agent_response, get_topic_log
+from .base import Agent
 
-def run(topic: str):
-    memory = "\n".join([m["content"] for m in get_topic_log(topic)])
-    prompt = f"Summarize the following content in 3 bullet points:\n\n{memory}"
-    summary = call_llm(prompt)
-    log_agent_response(topic, "Summarizer Agent", summary)
-    return summary
\ No newline at end of file
+
+class SummarizerAgent(Agent):
+    name = "Summarizer"
+    log_name = "Summarizer Agent"
+    uses_context = True
+
+    def run(self, topic: str, context: str = None, query: str = None, writes=None) -> str:
+        content = context or self.memory(topic, writes)
+        prompt = f"Summarize the following content in 3 bullet points:\n\n{content}"
+        return self.respond(topic, prompt, writes)
@@ -1,5 +1,7 @@
 import os
 import sys
+import asyncio
+import threading
 from datetime import datetime
 from typing import List, Dict, Optional
 
@@ -8,28 +10,33 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-import atexit
-
-from agents import devil_agent, insight_agent, research_agent, summarizer_agent
-from agents.base import (
-    log_agent_response, get_topic_log, create_workflow, get_workflow,
-    get_all_workflows, update_workflow, delete_workflow, create_workflow_session,
-    update_session_status, add_session_result, get_session, get_workflow_sessions,
-    notify_workflow_completion, format_workflow_results
+
+from agents.devil_agent import DevilAgent
+from agents.insight_agent import InsightAgent
+from agents.research_agent import ResearchAgent
+from agents.summarizer_agent import SummarizerAgent
+from agents.base import notify_workflow_completion, format_workflow_results, warm_up_connections
+from agents.store import (
+    get_topic_log, create_workflow, get_workflow, get_all_workflows, update_workflow,
+    delete_workflow, create_workflow_session, update_session_status, get_session,
+    get_workflow_sessions, checkpoint, WorkflowWriteBuffer, StepWrites
 )
 
 app = FastAPI(title="Agent Workflow Engine API")
+# Session payloads embed full agent output; compress anything past a small JSON body
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
-# Initialize scheduler
-scheduler = BackgroundScheduler()
-scheduler.start()
+# Initialize scheduler (started on the app's event loop at startup)
+scheduler = AsyncIOScheduler()
 
-# Shutdown scheduler when app stops
-atexit.register(lambda: scheduler.shutdown())
+# Admission control: runs beyond this limit wait for a free slot
+MAX_CONCURRENT_WORKFLOWS = int(os.getenv("MAX_CONCURRENT_WORKFLOWS", "4"))
+_workflow_slots: Optional[asyncio.Semaphore] = None
 
 
 # ---------- Request Models ----------
@@ -56,9 +63,38 @@ class RunWorkflowRequest(BaseModel):
 
 
 # ---------- Workflow Execution Logic ----------
-def execute_workflow(workflow_id: str, manual_query: str = None):
-    """Execute a workflow by running its agents in sequence."""
-    workflow = get_workflow(workflow_id)
+# One shared instance per agent type, reused across all workflow runs
+_AGENTS = {
+    agent.name: agent
+    for agent in (ResearchAgent(), SummarizerAgent(), InsightAgent(), DevilAgent())
+}
+
+def run_agent(agent_name: str, topic: str, previous_output: str = None,
+              manual_query: str = None, writes: StepWrites = None) -> str:
+    """Run a single agent (blocking) and return its output."""
+    agent = _AGENTS.get(agent_name)
+    if agent is None:
+        raise ValueError(f"Unknown agent: {agent_name}")
+    return agent.run(topic, context=previous_output, query=manual_query, writes=writes)
+
+
+def validate_agents(agents: List[str]):
+    """Reject agent names that have no registered implementation."""
+    for agent_name in agents:
+        if agent_name not in _AGENTS:
+            raise HTTPException(status_code=400, detail=f"Invalid agent: {agent_name}")
+
+
+async def execute_workflow(workflow_id: str, manual_query: str = None):
+    """Execute a workflow once one of the concurrent workflow slots is free."""
+    async with _workflow_slots:
+        await _run_workflow(workflow_id, manual_query)
+
+
+async def _run_workflow(workflow_id: str, manual_query: str = None):
+    """Run a workflow's agents, concurrently where their inputs allow."""
+    # Database and notification work blocks, so none of it runs on the event loop
+    workflow = await asyncio.to_thread(get_workflow, workflow_id)
     if not workflow:
         print(f"Workflow {workflow_id} not found")
         return
@@ -68,56 +104,90 @@ def execute_workflow(workflow_id: str, manual_query: str = None):
         return
 
     # Create new session
-    session_id = create_workflow_session(workflow_id)
+    session_id = await asyncio.to_thread(create_workflow_session, workflow_id)
     topic = workflow["topic"]
 
     print(f"Starting workflow '{workflow['name']}' for topic '{topic}' (Session: {session_id})")
 
+    # Stays "failed" unless the run gets through; cancellation skips except Exception
+    status = "failed"
+    # Session writes are buffered and committed together when the run ends
+    writes = WorkflowWriteBuffer()
     try:
-        # Execute agents in sequence
-        previous_output = None
-
-        for agent_name in workflow["agents"]:
+        loop = asyncio.get_running_loop()
+        agents = workflow["agents"]
+        # When each step finished, so results keep their own completion times
+        finished_at: Dict[int, str] = {}
+
+        async def run_step(index: int, earlier: List[asyncio.Future]) -> str:
+            agent_name = agents[index]
+            agent = _AGENTS[agent_name]
+            previous_output = None
+            if earlier:
+                await asyncio.wait(earlier)
+                previous = earlier[-1]
+                # A failed predecessor leaves this agent without context
+                if agent.uses_context and previous.exception() is None:
+                    previous_output = previous.result()
+            print(f"Running {agent_name} agent...")
             try:
-                print(f"Running {agent_name} agent...")
-
-                if agent_name == "Devil":
-                    output = devil_agent.run(topic)
-                elif agent_name == "Insight":
-                    if previous_output:
-                        # Use previous agent's output as context
-                        output = insight_agent.run(f"{topic}. Previous analysis: {previous_output}")
-                    else:
-                        output = insight_agent.run(topic)
-                elif agent_name == "Research":
-                    query = manual_query or f"latest developments in {topic}"
-                    output = research_agent.run(topic, query)
-                elif agent_name == "Summarizer":
-                    if previous_output:
-                        output = summarizer_agent.run(f"{topic}. Content to summarize: {previous_output}")
-                    else:
-                        output = summarizer_agent.run(topic)
-                else:
-                    raise ValueError(f"Unknown agent: {agent_name}")
-
-                # Log the response
-                log_agent_response(topic, agent_name, output, session_id)
-                add_session_result(session_id, agent_name, output)
-
-                # Use this output as input for next agent
-                previous_output = output
-
-            except Exception as e:
-                error_msg = f"Error running {agent_name}: {str(e)}"
+                # Agents make blocking LLM calls, so run them off the event loop
+                output = await loop.run_in_executor(
+                    None, run_agent, agent_name, topic, previous_output, manual_query,
+                    writes.for_step(index)
+                )
+            finally:
+                finished_at[index] = datetime.utcnow().isoformat()
+
+            # Log the response now, so later memory readers in this run see it
+            writes.log_agent_response(topic, agent_name, output, session_id, step=index)
+            return output
+
+        # Agents that read topic memory or take the previous output wait for every
+        # earlier step; the rest (Research) start right away
+        steps = []
+        for index, agent_name in enumerate(agents):
+            agent = _AGENTS.get(agent_name)
+            waits = agent is not None and (agent.reads_memory or agent.uses_context)
+            steps.append(asyncio.ensure_future(run_step(index, list(steps) if waits else [])))
+
+        outputs = await asyncio.gather(*steps, return_exceptions=True)
+
+        # Record results in workflow order, stamped with when each step finished
+        for index, (agent_name, output) in enumerate(zip(agents, outputs)):
+            timestamp = finished_at.get(index)
+            if isinstance(output, Exception):
+                error_msg = f"Error running {agent_name}: {str(output)}"
                 print(error_msg)
-                add_session_result(session_id, agent_name, None, error_msg)
+                writes.add_session_result(session_id, agent_name, None, error_msg, timestamp)
+                continue
 
-        # Mark session as completed
-        update_session_status(session_id, "completed", datetime.utcnow().isoformat())
+            writes.add_session_result(session_id, agent_name, output, timestamp=timestamp)
 
         # Update workflow last run time
-        update_workflow(workflow_id, {"last_run": datetime.utcnow().isoformat()})
+        writes.update_workflow(workflow_id, {"last_run": datetime.utcnow().isoformat()})
+        status = "completed"
+
+    except Exception as e:
+        print(f"Workflow execution failed: {str(e)}")
 
+    finally:
+        writes.update_session_status(session_id, status, datetime.utcnow().isoformat())
+        # Shielded so a cancelled run still commits its buffered writes and final status
+        await asyncio.shield(asyncio.to_thread(_finish_workflow, workflow, session_id, status, writes))
+
+
+def _finish_workflow(workflow: Dict, session_id: str, status: str, writes: WorkflowWriteBuffer):
+    """Commit a run's buffered writes and send its notifications (blocking)."""
+    writes.flush()
+
+    # Durability point for the run's writes
+    checkpoint()
+
+    if status != "completed":
+        return
+
+    try:
         # Send notifications
         session = get_session(session_id)
         notify_workflow_completion(workflow, session)
@@ -149,7 +219,11 @@ def schedule_workflow(workflow_id: str):
             CronTrigger.from_crontab(workflow["schedule"]),
             args=[workflow_id],
             id=workflow_id,
-            name=f"Workflow: {workflow['name']}"
+            name=f"Workflow: {workflow['name']}",
+            # Never overlap runs of the same workflow; collapse missed fires into one
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=60
         )
 
         return True
@@ -168,7 +242,7 @@ def unschedule_workflow(workflow_id: str):
 
 
 # ---------- Routes ----------
-@app.get("/")
+@app.api_route("/", methods=["GET", "HEAD"])
 def root():
     return {"message": "Agent Workflow Engine API is running 🤖⚙️"}
 
@@ -177,11 +251,7 @@ def root():
 def create_workflow_endpoint(request: CreateWorkflowRequest):
     """Create a new workflow."""
     try:
-        # Validate agents
-        valid_agents = ["Devil", "Insight", "Research", "Summarizer"]
-        for agent in request.agents:
-            if agent not in valid_agents:
-                raise HTTPException(status_code=400, detail=f"Invalid agent: {agent}")
+        validate_agents(request.agents)
 
         # Create workflow
         workflow_id = create_workflow(
@@ -239,11 +309,7 @@ def update_workflow_endpoint(workflow_id: str, request: UpdateWorkflowRequest):
         if request.topic is not None:
             updates["topic"] = request.topic
         if request.agents is not None:
-            # Validate agents
-            valid_agents = ["Devil", "Insight", "Research", "Summarizer"]
-            for agent in request.agents:
-                if agent not in valid_agents:
-                    raise HTTPException(status_code=400, detail=f"Invalid agent: {agent}")
+            validate_agents(request.agents)
             updates["agents"] = request.agents
         if request.schedule is not None:
             updates["schedule"] = request.schedule
@@ -304,15 +370,32 @@ def run_workflow_manually(workflow_id: str, request: RunWorkflowRequest,
 
 
 @app.get("/workflows/{workflow_id}/sessions")
-def get_workflow_sessions_endpoint(workflow_id: str):
-    """Get all sessions for a workflow."""
+def get_workflow_sessions_endpoint(
+        workflow_id: str,
+        status: Optional[str] = None,
+        limit: Optional[int] = Query(None, ge=1, le=200),
+        cursor: Optional[str] = None
+):
+    """Get sessions for a workflow; with ``limit``, pages of the newest sessions first."""
     workflow = get_workflow(workflow_id)
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
+    before = None
+    if cursor:
+        started_at, _, session_id = cursor.partition("|")
+        if not session_id:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        before = (started_at, session_id)
+
     try:
-        sessions = get_workflow_sessions(workflow_id)
-        return {"workflow_id": workflow_id, "sessions": sessions}
+        # Ask for one extra row to learn whether another page exists
+        sessions = get_workflow_sessions(workflow_id, status, limit + 1 if limit else None, before)
+        next_cursor = None
+        if limit and len(sessions) > limit:
+            sessions = sessions[:limit]
+            next_cursor = f"{sessions[-1]['started_at']}|{sessions[-1]['id']}"
+        return {"workflow_id": workflow_id, "sessions": sessions, "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving sessions: {str(e)}")
 
@@ -378,8 +461,17 @@ def get_scheduler_status():
         raise HTTPException(status_code=500, detail=f"Error getting scheduler status: {str(e)}")
 
 
+@app.get("/dashboard/bundle")
+def get_dashboard_bundle():
+    """Get workflows and scheduler status in a single response."""
+    return {
+        "workflows": list_workflows()["workflows"],
+        "scheduler_status": get_scheduler_status()
+    }
+
+
 @app.post("/scheduler/start")
-def start_scheduler():
+async def start_scheduler():
     """Start the scheduler (if stopped)."""
     try:
         if not scheduler.running:
@@ -390,7 +482,7 @@ def start_scheduler():
 
 
 @app.post("/scheduler/stop")
-def stop_scheduler():
+async def stop_scheduler():
     """Stop the scheduler."""
     try:
         if scheduler.running:
@@ -402,8 +494,13 @@ def stop_scheduler():
 
 # Load existing workflows into scheduler on startup
 @app.on_event("startup")
-def load_workflows():
-    """Load existing workflows into scheduler on startup."""
+async def load_workflows():
+    """Start the scheduler and load existing workflows into it."""
+    global _workflow_slots
+    # Created here so the semaphore belongs to the server's event loop
+    _workflow_slots = asyncio.Semaphore(MAX_CONCURRENT_WORKFLOWS)
+    scheduler.start()
+
     try:
         workflows = get_all_workflows()
         scheduled_count = 0
@@ -414,10 +511,26 @@ def load_workflows():
                     scheduled_count += 1
 
         print(f"Loaded {scheduled_count} workflows into scheduler")
+
+        # Open LLM/Slack connections in the background so startup isn't delayed
+        slack_webhooks = [
+            workflow.get("notification_config", {}).get("slack_webhook")
+            for workflow in workflows
+        ]
+        threading.Thread(
+            target=warm_up_connections, args=(slack_webhooks,), name="warm-up", daemon=True
+        ).start()
     except Exception as e:
         print(f"Error loading workflows: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_scheduler():
+    """Stop the scheduler when the app stops."""
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,29 +1,34 @@
 import os
+import shutil
+import tempfile
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, Iterator, List
 
-import pdfkit
+import orjson
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from urllib3.util.retry import Retry
 
 st.set_page_config(page_title="Agent Workflow Engine", layout="wide", page_icon="🤖")
 
 # --- Configuration ---
 API_URL = "http://localhost:8000"
+# Ceiling for read requests, so an unresponsive backend can't hang a render
+API_TIMEOUT = 10
 
-# Configuration for PDF export
-try:
-    path_wkhtmltopdf = pdfkit.configuration().wkhtmltopdf
-    config_pdf = pdfkit.configuration(wkhtmltopdf=path_wkhtmltopdf)
-    PDF_AVAILABLE = True
-except OSError:
-    path_wkhtmltopdf = r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe'
-    if os.path.exists(path_wkhtmltopdf):
-        config_pdf = pdfkit.configuration(wkhtmltopdf=path_wkhtmltopdf)
-        PDF_AVAILABLE = True
-    else:
-        PDF_AVAILABLE = False
+# Configuration for PDF export: a PATH lookup only, pdfkit is imported on first export
+WINDOWS_WKHTMLTOPDF = r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe'
+WKHTMLTOPDF_PATH = shutil.which("wkhtmltopdf") or (
+    WINDOWS_WKHTMLTOPDF if os.path.exists(WINDOWS_WKHTMLTOPDF) else None
+)
+PDF_AVAILABLE = WKHTMLTOPDF_PATH is not None
+PDF_OPTIONS = {"encoding": "UTF-8", "load-error-handling": "ignore", "disable-smart-shrinking": ""}
 
 # Visual settings for each agent
 AGENT_VISUALS = {
@@ -33,6 +38,8 @@ AGENT_VISUALS = {
     "Devil": {"icon": "😈", "color": "#F44336"},
     "default": {"icon": "🤖", "color": "#9E9E9E"}
 }
+# (icon, color) per agent, for render loops
+AGENT_ROW = {agent: (v["icon"], v["color"]) for agent, v in AGENT_VISUALS.items()}
 
 SCHEDULE_PRESETS = {
     "Daily at 9 AM": "0 9 * * *",
@@ -42,65 +49,250 @@ SCHEDULE_PRESETS = {
     "Weekly on Sunday": "0 9 * * 0",
     "Custom": "custom"
 }
+SCHEDULE_PRESET_KEYS = tuple(SCHEDULE_PRESETS)
 
 
 # --- Helper Functions ---
-@st.cache_data(ttl=30)
+@st.cache_resource
+def http() -> requests.Session:
+    """Shared HTTP session so every backend call reuses pooled keep-alive connections."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.1)
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"})
+    return session
+
+
+API_DOWN_BACKOFF = 10
+
+
+@st.cache_resource
+def _probe_http() -> requests.Session:
+    """Session for the health probe; no retries, so a dead backend costs one timeout."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _api_reachable():
+    """HEAD the backend root; raises when unreachable so failures are never cached."""
+    response = _probe_http().head(f"{API_URL}/", timeout=1)
+    response.raise_for_status()
+    return True
+
+
+def _api_backing_off() -> bool:
+    """True while a recent failed probe says the backend is down."""
+    return time.time() < st.session_state.get("_api_down_until", 0)
+
+
 def check_api_status():
-    """Check if the FastAPI backend is running."""
+    """Check if the FastAPI backend is running, without re-probing a dead one for a while."""
+    if _api_backing_off():
+        return False
     try:
-        response = requests.get(f"{API_URL}/", timeout=5)
-        return response.status_code == 200
-    except:
+        return _api_reachable()
+    except requests.RequestException:
+        st.session_state["_api_down_until"] = time.time() + API_DOWN_BACKOFF
         return False
 
 
-@st.cache_data(ttl=60)
-def fetch_workflows():
-    """Fetch all workflows from the API."""
+def _format_timestamp(value: str, fmt: str = '%Y-%m-%d %H:%M:%S') -> str:
+    """Format an ISO timestamp for display, falling back to the raw value."""
     try:
-        response = requests.get(f"{API_URL}/workflows")
-        response.raise_for_status()
-        return response.json().get("workflows", [])
+        return datetime.fromisoformat(value).strftime(fmt)
+    except (TypeError, ValueError):
+        return value
+
+
+@st.cache_data(ttl=30, max_entries=128, show_spinner=False)
+def _load_dashboard_bundle():
+    """GET workflows and scheduler status; raises on failure so errors are never cached."""
+    response = http().get(f"{API_URL}/dashboard/bundle", timeout=API_TIMEOUT)
+    response.raise_for_status()
+    bundle = orjson.loads(response.content)
+    # Format display timestamps once per cache window rather than on every rerun
+    for workflow in bundle.get("workflows", []):
+        if workflow.get("last_run"):
+            workflow["last_run_fmt"] = _format_timestamp(workflow["last_run"], '%Y-%m-%d %H:%M')
+    for job in bundle.get("scheduler_status", {}).get("active_jobs", []):
+        if job.get("next_run"):
+            job["next_run_fmt"] = _format_timestamp(job["next_run"])
+    return bundle
+
+
+def fetch_dashboard_bundle():
+    """Fetch workflows and scheduler status in a single request."""
+    try:
+        return _load_dashboard_bundle()
     except Exception as e:
-        st.error(f"Error fetching workflows: {e}")
-        return []
+        st.error(f"Error fetching dashboard data: {e}")
+        return {}
+
+
+def fetch_workflows():
+    """Get all workflows from the dashboard bundle."""
+    return fetch_dashboard_bundle().get("workflows", [])
 
 
-@st.cache_data(ttl=30)
 def fetch_scheduler_status():
-    """Fetch scheduler status."""
-    try:
-        response = requests.get(f"{API_URL}/scheduler/status")
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        st.error(f"Error fetching scheduler status: {e}")
-        return {}
+    """Get scheduler status from the dashboard bundle."""
+    return fetch_dashboard_bundle().get("scheduler_status", {})
 
 
-@st.cache_data(ttl=30)
-def fetch_workflow_sessions(workflow_id: str):
-    """Fetch sessions for a workflow."""
-    try:
-        response = requests.get(f"{API_URL}/workflows/{workflow_id}/sessions")
-        response.raise_for_status()
-        return response.json().get("sessions", [])
-    except Exception as e:
-        st.error(f"Error fetching sessions: {e}")
-        return []
+@st.cache_resource
+def _prefetch_pool() -> ThreadPoolExecutor:
+    """Workers for requests that overlap the health probe, shared by every session."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+def prefetch(fn: Callable) -> Future:
+    """Start fn on a background worker; results land in fn's own st.cache_data entry."""
+    # The worker needs this run's script context so the cached call works there
+    ctx = get_script_run_ctx()
+
+    def call():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+
+    return _prefetch_pool().submit(call)
+
+
+SESSIONS_TTL = 30
+SESSIONS_PAGE_SIZE = 20
+# Same bound as the st.cache_data fetches; the least recently used page is evicted first
+SESSIONS_CACHE_ENTRIES = 128
+
+
+class _SessionsCache:
+    """LRU map of {(workflow_id, status, limit, cursor): (fetched_at, page)}.
+
+    Shared by script runs and background refresh threads, so every access takes the lock.
+    """
 
+    def __init__(self, max_entries: int):
+        self._pages = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
 
-@st.cache_data(ttl=30)
-def fetch_session_results(session_id: str):
-    """Fetch results for a session."""
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is not None:
+                self._pages.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: tuple):
+        with self._lock:
+            self._pages[key] = entry
+            self._pages.move_to_end(key)
+            while len(self._pages) > self._max_entries:
+                self._pages.popitem(last=False)
+
+    def forget(self, workflow_id: str):
+        """Drop every cached page for a workflow."""
+        with self._lock:
+            for key in [key for key in self._pages if key[0] == workflow_id]:
+                del self._pages[key]
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+@st.cache_resource
+def _sessions_cache() -> _SessionsCache:
+    """Process-wide sessions pages, served stale-while-revalidate."""
+    return _SessionsCache(SESSIONS_CACHE_ENTRIES)
+
+
+@st.cache_resource
+def _sessions_refreshing() -> set:
+    """Sessions cache keys with a background refresh in flight."""
+    return set()
+
+
+def _forget_sessions(workflow_id: str):
+    """Drop every cached sessions page for a workflow."""
+    _sessions_cache().forget(workflow_id)
+
+
+def _load_sessions(session: requests.Session, key: tuple) -> Dict:
+    """GET one page of a workflow's sessions with their display timestamps pre-formatted."""
+    workflow_id, status, limit, cursor = key
+    params = {"limit": limit, "status": status, "cursor": cursor}
+    response = session.get(
+        f"{API_URL}/workflows/{workflow_id}/sessions",
+        params={k: v for k, v in params.items() if v is not None},
+        timeout=API_TIMEOUT
+    )
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+    sessions = data.get("sessions", [])
+    for s in sessions:
+        s["started_at_fmt"] = _format_timestamp(s["started_at"])
+        if s.get("completed_at"):
+            s["completed_at_fmt"] = _format_timestamp(s["completed_at"])
+    return {"sessions": sessions, "next_cursor": data.get("next_cursor")}
+
+
+def _refresh_sessions(session: requests.Session, key: tuple, cache: _SessionsCache, refreshing: set):
+    """Refetch a sessions page off the script thread; a failure keeps the stale copy.
+
+    The HTTP session and cache are handed in by the caller because this thread has no
+    script context, so it must not call st.cache_resource functions itself.
+    """
     try:
-        response = requests.get(f"{API_URL}/sessions/{session_id}/results")
-        response.raise_for_status()
-        return response.json()
+        cache.put(key, (time.time(), _load_sessions(session, key)))
     except Exception as e:
-        st.error(f"Error fetching session results: {e}")
-        return {}
+        print(f"Background session refresh failed for {key[0]}: {e}")
+    finally:
+        refreshing.discard(key)
+
+
+def _load_more_sessions(pages_key: str):
+    """Button callback: show one more page of sessions on the next run."""
+    st.session_state[pages_key] = st.session_state.get(pages_key, 1) + 1
+
+
+def fetch_workflow_sessions(workflow_id: str, status: str = None, limit: int = SESSIONS_PAGE_SIZE,
+                            cursor: str = None) -> Dict:
+    """Fetch one page of a workflow's sessions, newest first, with results and errors.
+
+    Returns {"sessions": [...], "next_cursor": ...}. Only the first load of a page blocks.
+    After that the cached copy is returned at once and refreshed in the background while a
+    session is still running or the copy is stale; finished sessions never change, so an
+    all-finished page is kept until the TTL lapses.
+    """
+    key = (workflow_id, status, limit, cursor)
+    cache, refreshing = _sessions_cache(), _sessions_refreshing()
+    cached = cache.get(key)
+
+    if cached is None:
+        try:
+            page = _load_sessions(http(), key)
+        except Exception as e:
+            st.error(f"Error fetching sessions: {e}")
+            return {"sessions": [], "next_cursor": None}
+        cache.put(key, (time.time(), page))
+        return page
+
+    fetched_at, page = cached
+    running = any(s.get("status") == "running" for s in page["sessions"])
+    if (running or time.time() - fetched_at > SESSIONS_TTL) and key not in refreshing:
+        refreshing.add(key)
+        threading.Thread(
+            target=_refresh_sessions, args=(http(), key, cache, refreshing), daemon=True
+        ).start()
+    return page
 
 
 def create_workflow(name: str, topic: str, agents: List[str], schedule: str,
@@ -114,9 +306,9 @@ def create_workflow(name: str, topic: str, agents: List[str], schedule: str,
             "schedule": schedule,
             "notification_config": notification_config or {}
         }
-        response = requests.post(f"{API_URL}/workflows", json=payload)
+        response = http().post(f"{API_URL}/workflows", json=payload)
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
     except Exception as e:
         st.error(f"Error creating workflow: {e}")
         return None
@@ -129,9 +321,9 @@ def run_workflow_manually(workflow_id: str, manual_query: str = None):
         if manual_query:
             payload["manual_query"] = manual_query
 
-        response = requests.post(f"{API_URL}/workflows/{workflow_id}/run", json=payload)
+        response = http().post(f"{API_URL}/workflows/{workflow_id}/run", json=payload)
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
     except Exception as e:
         st.error(f"Error running workflow: {e}")
         return None
@@ -140,7 +332,7 @@ def run_workflow_manually(workflow_id: str, manual_query: str = None):
 def delete_workflow(workflow_id: str):
     """Delete a workflow."""
     try:
-        response = requests.delete(f"{API_URL}/workflows/{workflow_id}")
+        response = http().delete(f"{API_URL}/workflows/{workflow_id}")
         response.raise_for_status()
         return True
     except Exception as e:
@@ -152,7 +344,7 @@ def update_workflow_status(workflow_id: str, active: bool):
     """Update workflow active status."""
     try:
         payload = {"active": active}
-        response = requests.put(f"{API_URL}/workflows/{workflow_id}", json=payload)
+        response = http().put(f"{API_URL}/workflows/{workflow_id}", json=payload)
         response.raise_for_status()
         return True
     except Exception as e:
@@ -160,10 +352,13 @@ def update_workflow_status(workflow_id: str, active: bool):
         return False
 
 
-def generate_workflow_report(sessions: List[Dict], workflow_name: str):
-    """Generate HTML report for workflow sessions."""
-    html = f"<html><head><title>Workflow Report: {workflow_name}</title>"
-    html += """
+def flash(message: str):
+    """Queue a toast for the next run, so an action can confirm itself and rerun at once."""
+    st.session_state["_flash"] = message
+
+
+# Static parts of the report page; only the title is per-report
+_REPORT_HEAD = """
     <style>
         body { font-family: sans-serif; margin: 20px; }
         .session { border: 1px solid #ddd; padding: 15px; margin-bottom: 15px; border-radius: 5px; }
@@ -173,39 +368,88 @@ def generate_workflow_report(sessions: List[Dict], workflow_name: str):
         h1, h2 { color: #333; }
     </style>
     </head><body>"""
-    html += f"<h1>🤖 Workflow Report: {workflow_name}</h1>"
-    html += f"<p>Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>"
-    html += f"<p>Total sessions: {len(sessions)}</p><hr>"
+_REPORT_FOOT = "</body></html>"
+
+
+def iter_report(sessions: List[Dict], workflow_name: str) -> Iterator[str]:
+    """Yield the HTML report for workflow sessions one session at a time."""
+    yield f"<html><head><title>Workflow Report: {workflow_name}</title>"
+    yield _REPORT_HEAD
+    yield (f"<h1>🤖 Workflow Report: {workflow_name}</h1>"
+           f"<p>Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>"
+           f"<p>Total sessions: {len(sessions)}</p><hr>")
 
     for session in sessions:
         status_color = "#4CAF50" if session["status"] == "completed" else "#F44336"
-        html += f'<div class="session">'
-        html += f'<div class="session-header" style="border-left: 4px solid {status_color};">'
-        html += f'<h3>Session: {session["started_at"]}</h3>'
-        html += f'<p>Status: {session["status"]} | Duration: {session.get("completed_at", "Running...")}</p>'
-        html += '</div>'
+        parts: List[str] = [
+            f'<div class="session">',
+            f'<div class="session-header" style="border-left: 4px solid {status_color};">',
+            f'<h3>Session: {session["started_at"]}</h3>',
+            f'<p>Status: {session["status"]} | Duration: {session.get("completed_at", "Running...")}</p>',
+            '</div>'
+        ]
 
         for result in session.get("results", []):
-            agent_color = AGENT_VISUALS.get(result["agent"], AGENT_VISUALS["default"])["color"]
-            html += f'<div class="agent-result" style="border-left-color: {agent_color};">'
-            html += f'<strong>{result["agent"]}:</strong><br>{result["result"]}'
-            html += '</div>'
+            _, agent_color = AGENT_ROW.get(result["agent"], AGENT_ROW["default"])
+            parts.append(f'<div class="agent-result" style="border-left-color: {agent_color};">')
+            parts.append(f'<strong>{result["agent"]}:</strong><br>{result["result"]}')
+            parts.append('</div>')
 
         for error in session.get("errors", []):
-            html += f'<div class="agent-result error">'
-            html += f'<strong>Error in {error["agent"]}:</strong><br>{error["error"]}'
-            html += '</div>'
+            parts.append(f'<div class="agent-result error">')
+            parts.append(f'<strong>Error in {error["agent"]}:</strong><br>{error["error"]}')
+            parts.append('</div>')
+
+        parts.append('</div>')
+        yield "".join(parts)
 
-        html += '</div>'
+    yield _REPORT_FOOT
 
-    html += "</body></html>"
-    return html
+
+@st.cache_resource
+def load_pdfkit():
+    """Import pdfkit and build its configuration once, when a PDF is first exported."""
+    import pdfkit
+    return pdfkit, pdfkit.configuration(wkhtmltopdf=WKHTMLTOPDF_PATH)
+
+
+def pdf_download_button(report_chunks: Iterable[str], file_name: str):
+    """Render streamed report HTML to PDF through temp files and offer it for download."""
+    pdfkit, config_pdf = load_pdfkit()
+    html_path = pdf_path = None
+    try:
+        with tempfile.NamedTemporaryFile("w", suffix=".html", encoding="utf-8", delete=False) as html_file:
+            # Written chunk by chunk, so the full report never sits in memory
+            html_file.writelines(report_chunks)
+            html_path = html_file.name
+        pdf_path = html_path[:-len(".html")] + ".pdf"
+        pdfkit.from_file(html_path, pdf_path, configuration=config_pdf, options=PDF_OPTIONS)
+
+        with open(pdf_path, "rb") as pdf_file:
+            st.download_button(
+                "⬇️ Download PDF",
+                data=pdf_file,
+                file_name=file_name,
+                mime="application/pdf"
+            )
+    finally:
+        for path in (html_path, pdf_path):
+            if path and os.path.exists(path):
+                os.remove(path)
 
 
 # --- Main Application ---
 st.title("🤖 Agent Workflow Engine")
+
+# Confirmation left by an action on the previous run
+if "_flash" in st.session_state:
+    st.toast(st.session_state.pop("_flash"))
 st.markdown("*Automated multi-agent collaboration with scheduling*")
 
+# Load the dashboard bundle while the probe runs, unless the backend is known to be
+# down; a failed probe stops the page without waiting for it
+bundle_prefetch = None if _api_backing_off() else prefetch(_load_dashboard_bundle)
+
 # Check API status
 if not check_api_status():
     st.error("❌ FastAPI backend is not running! Please start the backend server first.")
@@ -214,6 +458,10 @@ if not check_api_status():
 else:
     st.success("✅ Connected to Agent Workflow Engine API")
 
+if bundle_prefetch is not None:
+    # Pages read the warm cache; a failed load is retried and reported by fetch_dashboard_bundle
+    wait((bundle_prefetch,))
+
 # --- Sidebar Navigation ---
 st.sidebar.title("🗂️ Navigation")
 page = st.sidebar.radio(
@@ -225,6 +473,7 @@ page = st.sidebar.radio(
 # Clear cache button
 if st.sidebar.button("🔄 Refresh Data"):
     st.cache_data.clear()
+    _sessions_cache().clear()
     st.rerun()
 
 st.sidebar.markdown("---")
@@ -254,8 +503,7 @@ if page == "🏠 Dashboard":
                     st.write(f"**Agents:** {' → '.join(workflow['agents'])}")
                     st.write(f"**Schedule:** `{workflow['schedule']}`")
                     if workflow.get('last_run'):
-                        last_run = datetime.fromisoformat(workflow['last_run']).strftime('%Y-%m-%d %H:%M')
-                        st.write(f"**Last Run:** {last_run}")
+                        st.write(f"**Last Run:** {workflow['last_run_fmt']}")
 
                 with col2:
                     if workflow.get('notification_config'):
@@ -271,8 +519,9 @@ if page == "🏠 Dashboard":
                         with st.spinner("Starting workflow..."):
                             result = run_workflow_manually(workflow['id'])
                             if result:
-                                st.success("✅ Workflow started!")
-                                time.sleep(2)
+                                # The new run must show up on the next sessions fetch
+                                _forget_sessions(workflow['id'])
+                                flash("✅ Workflow started!")
                                 st.rerun()
 
                     current_status = workflow.get('active', True)
@@ -281,14 +530,15 @@ if page == "🏠 Dashboard":
 
                     if st.button(status_label, key=f"toggle_{workflow['id']}"):
                         if update_workflow_status(workflow['id'], new_status):
-                            st.success(f"✅ Workflow {'activated' if new_status else 'paused'}!")
-                            st.cache_data.clear()
+                            flash(f"✅ Workflow {'activated' if new_status else 'paused'}!")
+                            _load_dashboard_bundle.clear()
                             st.rerun()
 
                     if st.button(f"🗑️ Delete", key=f"delete_{workflow['id']}"):
                         if delete_workflow(workflow['id']):
-                            st.success("✅ Workflow deleted!")
-                            st.cache_data.clear()
+                            flash("✅ Workflow deleted!")
+                            _load_dashboard_bundle.clear()
+                            _forget_sessions(workflow['id'])
                             st.rerun()
 
 elif page == "➕ Create Workflow":
@@ -304,17 +554,18 @@ elif page == "➕ Create Workflow":
             # Agent selection
             st.subheader("Select Agents (in execution order)")
             available_agents = ["Research", "Summarizer", "Insight", "Devil"]
-            selected_agents = []
-
-            for agent in available_agents:
-                visuals = AGENT_VISUALS[agent]
-                if st.checkbox(f"{visuals['icon']} {agent}", key=f"agent_{agent}"):
-                    selected_agents.append(agent)
+            selected_agents = st.multiselect(
+                "Agents",
+                available_agents,
+                default=[],
+                format_func=lambda agent: f"{AGENT_ROW[agent][0]} {agent}",
+                help="Agents run in the order they are picked"
+            )
 
         with col2:
             # Schedule configuration
             st.subheader("Schedule Configuration")
-            schedule_type = st.selectbox("Schedule Preset", list(SCHEDULE_PRESETS.keys()))
+            schedule_type = st.selectbox("Schedule Preset", SCHEDULE_PRESET_KEYS)
 
             if schedule_type == "Custom":
                 cron_expression = st.text_input(
@@ -363,10 +614,8 @@ elif page == "➕ Create Workflow":
                     )
 
                     if result:
-                        st.success(f"✅ Workflow '{workflow_name}' created successfully!")
-                        st.info(f"Workflow ID: `{result['workflow_id']}`")
-                        st.cache_data.clear()
-                        time.sleep(2)
+                        flash(f"✅ Workflow '{workflow_name}' created (ID: {result['workflow_id']})")
+                        _load_dashboard_bundle.clear()
                         st.rerun()
 
 elif page == "📊 Monitor Sessions":
@@ -384,32 +633,33 @@ elif page == "📊 Monitor Sessions":
         if selected_workflow_name:
             workflow_id = workflow_options[selected_workflow_name]
 
-            # Fetch sessions
-            sessions = fetch_workflow_sessions(workflow_id)
+            # Filter options
+            col1, col2 = st.columns([1, 1])
+            with col1:
+                status_filter = st.selectbox("Filter by Status", ["All", "completed", "running", "failed"])
+            with col2:
+                show_results = st.checkbox("Show Detailed Results", value=True)
+
+            # Fetch sessions: the backend filters by status and pages newest first
+            pages_key = f"pages_{workflow_id}_{status_filter}"
+            sessions, cursor = [], None
+            for _ in range(st.session_state.get(pages_key, 1)):
+                page = fetch_workflow_sessions(workflow_id, None if status_filter == "All" else status_filter,
+                                               cursor=cursor)
+                sessions.extend(page["sessions"])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
 
             if not sessions:
                 st.info("ℹ️ No execution sessions found for this workflow.")
             else:
-                st.markdown(f"**Total Sessions:** {len(sessions)}")
-
-                # Filter options
-                col1, col2 = st.columns([1, 1])
-                with col1:
-                    status_filter = st.selectbox("Filter by Status", ["All", "completed", "running", "failed"])
-                with col2:
-                    show_results = st.checkbox("Show Detailed Results", value=True)
-
-                # Filter sessions
-                filtered_sessions = sessions
-                if status_filter != "All":
-                    filtered_sessions = [s for s in sessions if s.get("status") == status_filter]
-
-                # Sort by most recent
-                filtered_sessions.sort(key=lambda x: x.get("started_at", ""), reverse=True)
+                st.markdown(f"**Sessions Shown:** {len(sessions)}")
 
+                export_slot = st.container()
                 st.markdown("---")
 
-                for session in filtered_sessions:
+                for session in sessions:
                     status = session.get("status", "unknown")
                     status_color = {
                         "completed": "🟢",
@@ -417,7 +667,7 @@ elif page == "📊 Monitor Sessions":
                         "failed": "🔴"
                     }.get(status, "⚪")
 
-                    started_at = datetime.fromisoformat(session["started_at"]).strftime('%Y-%m-%d %H:%M:%S')
+                    started_at = session["started_at_fmt"]
 
                     with st.expander(f"{status_color} Session {started_at} - {status.title()}", expanded=False):
                         col1, col2 = st.columns([2, 1])
@@ -425,55 +675,46 @@ elif page == "📊 Monitor Sessions":
                         with col1:
                             st.write(f"**Started:** {started_at}")
                             if session.get("completed_at"):
-                                completed_at = datetime.fromisoformat(session["completed_at"]).strftime(
-                                    '%Y-%m-%d %H:%M:%S')
-                                st.write(f"**Completed:** {completed_at}")
-
-                            if show_results:
-                                session_results = fetch_session_results(session["id"])
-                                if session_results:
-                                    st.markdown("**Results:**")
-                                    for result in session_results.get("raw_results", []):
-                                        agent_visuals = AGENT_VISUALS.get(result["agent"], AGENT_VISUALS["default"])
-                                        st.markdown(f"**{agent_visuals['icon']} {result['agent']}:**")
-                                        with st.container():
-                                            st.markdown(result["result"])
-                                        st.markdown("---")
-
-                                    # Show errors if any
-                                    if session_results.get("errors"):
-                                        st.markdown("**❌ Errors:**")
-                                        for error in session_results["errors"]:
-                                            st.error(f"{error['agent']}: {error['error']}")
+                                st.write(f"**Completed:** {session['completed_at_fmt']}")
+
+                            # Expander bodies render even when collapsed, so results are only
+                            # drawn for sessions whose details the user asked for
+                            if show_results and st.toggle("Load details", key=f"open_{session['id']}"):
+                                # Results and errors come embedded in the sessions payload
+                                st.markdown("**Results:**")
+                                for result in session.get("results", []):
+                                    icon, _ = AGENT_ROW.get(result["agent"], AGENT_ROW["default"])
+                                    st.markdown(f"**{icon} {result['agent']}:**")
+                                    with st.container():
+                                        st.markdown(result["result"])
+                                    st.markdown("---")
+
+                                # Show errors if any
+                                if session.get("errors"):
+                                    st.markdown("**❌ Errors:**")
+                                    for error in session["errors"]:
+                                        st.error(f"{error['agent']}: {error['error']}")
 
                         with col2:
-                            if PDF_AVAILABLE and show_results:
-                                if st.button(f"📄 Export PDF", key=f"export_{session['id']}"):
-                                    with st.spinner("Generating PDF..."):
-                                        try:
-                                            session_data = fetch_session_results(session["id"])
-                                            if session_data:
-                                                # Create a mini report for this session
-                                                report_html = f"<h1>Session Report</h1>"
-                                                report_html += f"<p>Session ID: {session['id']}</p>"
-                                                report_html += f"<p>Started: {started_at}</p>"
-                                                report_html += f"<p>Status: {status}</p><hr>"
-
-                                                for result in session_data.get("raw_results", []):
-                                                    report_html += f"<h3>{result['agent']}</h3>"
-                                                    report_html += f"<p>{result['result']}</p><hr>"
-
-                                                pdf_bytes = pdfkit.from_string(report_html, False,
-                                                                               configuration=config_pdf)
-
-                                                st.download_button(
-                                                    "⬇️ Download PDF",
-                                                    data=pdf_bytes,
-                                                    file_name=f"session_{session['id'][:8]}_{started_at.replace(':', '_')}.pdf",
-                                                    mime="application/pdf"
-                                                )
-                                        except Exception as e:
-                                            st.error(f"PDF generation failed: {e}")
+                            if PDF_AVAILABLE:
+                                st.checkbox("Select for export", key=f"pick_{session['id']}")
+
+                if cursor:
+                    st.button("⬇️ Load more", on_click=_load_more_sessions, args=(pages_key,))
+
+                # One wkhtmltopdf run for every picked session, shown above the list
+                picked = [s for s in sessions if st.session_state.get(f"pick_{s['id']}")]
+                if PDF_AVAILABLE and picked:
+                    with export_slot:
+                        if st.button(f"📄 Export {len(picked)} selected"):
+                            with st.spinner("Generating PDF..."):
+                                try:
+                                    pdf_download_button(
+                                        iter_report(picked, selected_workflow_name),
+                                        f"workflow_{workflow_id[:8]}_report.pdf"
+                                    )
+                                except Exception as e:
+                                    st.error(f"PDF generation failed: {e}")
 
 elif page == "⚙️ Scheduler Status":
     st.header("⚙️ Scheduler Management")
@@ -494,34 +735,27 @@ elif page == "⚙️ Scheduler Status":
             if active_jobs:
                 st.markdown("**Scheduled Jobs:**")
                 for job in active_jobs:
-                    next_run = "Not scheduled"
-                    if job.get("next_run"):
-                        try:
-                            next_run_dt = datetime.fromisoformat(job["next_run"])
-                            next_run = next_run_dt.strftime('%Y-%m-%d %H:%M:%S')
-                        except:
-                            next_run = job["next_run"]
-
+                    next_run = job.get("next_run_fmt", "Not scheduled")
                     st.markdown(f"• **{job['name']}** - Next run: {next_run}")
 
         with col2:
             if scheduler_status.get("scheduler_running"):
                 if st.button("⏸️ Stop Scheduler"):
                     try:
-                        response = requests.post(f"{API_URL}/scheduler/stop")
+                        response = http().post(f"{API_URL}/scheduler/stop")
                         if response.status_code == 200:
-                            st.success("✅ Scheduler stopped!")
-                            st.cache_data.clear()
+                            flash("✅ Scheduler stopped!")
+                            _load_dashboard_bundle.clear()
                             st.rerun()
                     except Exception as e:
                         st.error(f"Error stopping scheduler: {e}")
             else:
                 if st.button("▶️ Start Scheduler"):
                     try:
-                        response = requests.post(f"{API_URL}/scheduler/start")
+                        response = http().post(f"{API_URL}/scheduler/start")
                         if response.status_code == 200:
-                            st.success("✅ Scheduler started!")
-                            st.cache_data.clear()
+                            flash("✅ Scheduler started!")
+                            _load_dashboard_bundle.clear()
                             st.rerun()
                     except Exception as e:
                         st.error(f"Error starting scheduler: {e}")